@@ -3,23 +3,37 @@
 # ==============================================================================
 
 # --- PART 1: IMPORTS & SETUP ---
+import concurrent.futures
+import hashlib
 import os
-import json
 import logging
+import re
+import sqlite3
+import textwrap
+import time
 import traceback
-from typing import Dict, Any, List, Optional
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
 
+import orjson
 import google.generativeai as genai
 import docx
 import pdfplumber
 import pytesseract
 import spacy
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
 from dotenv import load_dotenv
-from pdf2image import convert_from_path
 from PIL import Image
-from googleapiclient.discovery import build
+
+# tesserocr keeps a long-lived Tesseract engine in-process; fall back to
+# the pytesseract subprocess-per-image path when it is not installed.
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
 
 # Configure professional logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -28,6 +42,216 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 load_dotenv()
 
 
+_GEMINI_MODEL = 'gemini-1.5-flash-latest'
+_PROMPT_VERSION = "1"
+_MAX_PROMPT_CHARS = 4000
+# Strips markdown code fences without eating legitimate leading/trailing
+# characters the way lstrip/rstrip's character-set semantics would
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+
+# Built once at import; per call only the article text is formatted in.
+_PROMPT_TEMPLATE = textwrap.dedent("""
+    Act as a professional fact-checker. Analyze the following text.
+    Provide your complete analysis as a single JSON object with the following keys:
+    - "verdict": (string, either "REAL" or "FAKE")
+    - "sentiment": (string, e.g., "Neutral", "Biased")
+    - "truthfulness_score": (integer, from 0 to 100)
+    - "main_claim": (string, a one-sentence summary of the main claim)
+    - "analysis_summary": (string, a 2-3 sentence explanation for your verdict)
+    - "scam_category": (string, if the verdict is FAKE, choose ONE from the following list: "Financial Fraud", "Health Misinformation", "Impersonation", "Job Scam", "General Fake News". If the verdict is REAL, this should be "N/A".)
+    - "past_examples": (a list of 1-2 strings with real-world examples that support your analysis)
+
+    Do not include any text or formatting outside of the JSON object itself.
+
+    Here is the text to analyze:
+    ---
+    {text}
+    ---
+    """)
+
+_LINK_MAP = {
+    "Financial Fraud": {
+        "link": "https://sachet.rbi.org.in/",
+        "description": "For financial fraud, report to the RBI's Sachet portal and the National Cyber Crime Portal."
+    },
+    "Health Misinformation": {
+        "link": "https://factcheck.pib.gov.in/",
+        "description": "Report health-related fake news to the Press Information Bureau (PIB) Fact Check unit."
+    },
+    "Job Scam": {
+        "link": "https://cybercrime.gov.in/",
+        "description": "Job scams are a serious crime. Report them immediately to the National Cyber Crime Portal."
+    },
+    "Impersonation": {
+        "link": "https://cybercrime.gov.in/",
+        "description": "Report impersonation on the social media platform itself and also to the National Cyber Crime Portal."
+    },
+    "General Fake News": {
+        "link": "https://factcheck.pib.gov.in/",
+        "description": "For general fake news, report to the Press Information Bureau (PIB) Fact Check unit."
+    }
+}
+
+
+def _crop_for_prompt(text: str, limit: int = _MAX_PROMPT_CHARS) -> str:
+    """Caps the text sent to Gemini, cutting at the last line or word break
+    before the limit so the model never sees a word sliced in half."""
+    if len(text) <= limit:
+        return text
+    cropped = text[:limit]
+    boundary = max(cropped.rfind('\n'), cropped.rfind(' '))
+    if boundary > limit // 2:
+        cropped = cropped[:boundary]
+    return cropped
+
+
+# Backing store for _GeminiCache below
+_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_cache.db")
+_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+class _GeminiCache:
+    """A small sqlite-backed cache so repeated texts skip the Gemini API."""
+
+    def __init__(self, path: str = _CACHE_PATH):
+        self._path = path
+        self._connect()
+
+    def _connect(self) -> None:
+        self._conn = sqlite3.connect(self._path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS gemini_cache (key TEXT PRIMARY KEY, response TEXT, created REAL)"
+        )
+        self._conn.commit()
+
+    def reset_connection(self) -> None:
+        """Reopens the sqlite connection; a connection inherited across a
+        fork must not be reused."""
+        self._connect()
+
+    @staticmethod
+    def key_for(text: str) -> str:
+        raw = (_GEMINI_MODEL + _PROMPT_VERSION + text.strip().lower()).encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        # A locked or corrupt cache db is a miss, never a failure
+        try:
+            row = self._conn.execute(
+                "SELECT response, created FROM gemini_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if not row or time.time() - row[1] > _CACHE_TTL_SECONDS:
+                return None
+            return orjson.loads(row[0])
+        except (sqlite3.Error, orjson.JSONDecodeError) as e:
+            logging.warning(f"Gemini cache read failed: {e}")
+            return None
+
+    def set(self, key: str, response: Dict[str, Any]) -> None:
+        # The caller already holds the analysis; losing the write is harmless
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO gemini_cache VALUES (?, ?, ?)",
+                (key, orjson.dumps(response), time.time())
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Gemini cache write failed: {e}")
+
+
+_IMG_EXTENSIONS = frozenset({'.png', '.jpg', '.jpeg', '.tiff', '.bmp'})
+# Only <p> tags are ever read from scraped pages, so skip the rest at parse time
+_ONLY_P_TAGS = SoupStrainer('p')
+_OCR_LANG = 'hin+eng'
+_OCR_DPI = 200           # enough for digital-born PDFs; pixels scale O(dpi^2)
+_OCR_FALLBACK_DPI = 300  # retried only on low-confidence pages (e.g. scans)
+_OCR_MIN_CONFIDENCE = 60
+_tess_api = None  # one persistent Tesseract handle per (worker) process
+
+
+def _get_tess_api():
+    global _tess_api
+    if _tess_api is None:
+        _tess_api = tesserocr.PyTessBaseAPI(lang=_OCR_LANG)
+    return _tess_api
+
+
+def _ocr_image(image: Image.Image) -> str:
+    """OCRs a PIL image, reusing a long-lived Tesseract API when tesserocr
+    is available instead of spawning a tesseract subprocess per image."""
+    if tesserocr is None:
+        return pytesseract.image_to_string(image, lang=_OCR_LANG)
+    api = _get_tess_api()
+    api.SetImage(image)
+    return api.GetUTF8Text()
+
+
+def _ocr_image_with_conf(image: Image.Image) -> Tuple[str, float]:
+    """OCRs a PIL image and also returns the mean word confidence, so the
+    caller can decide whether a higher-DPI retry is worthwhile."""
+    if tesserocr is not None:
+        api = _get_tess_api()
+        api.SetImage(image)
+        return api.GetUTF8Text(), float(api.MeanTextConf())
+    data = pytesseract.image_to_data(image, lang=_OCR_LANG, output_type=pytesseract.Output.DICT)
+    confidences = []
+    lines = []
+    current_line = []
+    last_line_key = None
+    for word, conf, block, par, line in zip(
+            data['text'], data['conf'], data['block_num'], data['par_num'], data['line_num']):
+        if float(conf) >= 0:
+            confidences.append(float(conf))
+        if not word.strip():
+            continue
+        line_key = (block, par, line)
+        if line_key != last_line_key and current_line:
+            lines.append(' '.join(current_line))
+            current_line = []
+        current_line.append(word)
+        last_line_key = line_key
+    if current_line:
+        lines.append(' '.join(current_line))
+    mean_conf = sum(confidences) / len(confidences) if confidences else 0.0
+    return '\n'.join(lines), mean_conf
+
+
+def _ocr_image_with_conf_safe(image: Image.Image) -> Tuple[str, float]:
+    """Pool-worker wrapper around _ocr_image_with_conf: a page that fails to
+    OCR yields empty zero-confidence output instead of poisoning the whole
+    executor.map batch."""
+    try:
+        return _ocr_image_with_conf(image)
+    except Exception as e:
+        logging.error(f"OCR failed for a page: {e}")
+        return "", 0.0
+
+
+def _render_pages(pdf, indices: List[int], resolution: int,
+                  file_path: str) -> List[Tuple[int, Image.Image]]:
+    """Renders the given PDF pages to PIL images, logging and skipping any
+    page that fails to render so the rest of the document still gets OCRed."""
+    rendered = []
+    for i in indices:
+        try:
+            rendered.append((i, pdf.pages[i].to_image(resolution=resolution).original))
+        except Exception as e:
+            logging.error(f"Failed to render page {i + 1} of {file_path}: {e}")
+    return rendered
+
+
+def _has_min_nonspace(text: str, threshold: int) -> bool:
+    """Returns True once text has more than threshold non-space characters,
+    stopping early instead of copying the whole page the way strip() does."""
+    count = 0
+    for char in text:
+        if not char.isspace():
+            count += 1
+            if count > threshold:
+                return True
+    return False
+
+
 # --- PART 2: THE ANALYSIS PIPELINE CLASS ---
 class MisinformationAnalyzer:
     """
@@ -40,74 +264,103 @@ class MisinformationAnalyzer:
             raise ValueError("Google Gemini API key not found in .env file.")
         genai.configure(api_key=config["GEMINI_API_KEY"])
 
-        # Configure paths for Tesseract and Poppler
+        # Configure the path for Tesseract
         pytesseract.pytesseract.tesseract_cmd = config.get("TESSERACT_CMD_PATH")
-        self.poppler_path = config.get("POPPLER_PATH")
         self.config = config
 
         # Load AI/ML models once on initialization
-        self.gemini_model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        self.spacy_nlp = spacy.load("en_core_web_sm")
+        self.gemini_model = genai.GenerativeModel(_GEMINI_MODEL)
+        self.gemini_cache = _GeminiCache()
+        # Only NER output is consumed, so skip the tagger/parser components
+        self.spacy_nlp = spacy.load(
+            "en_core_web_sm",
+            disable=["tagger", "parser", "attribute_ruler", "lemmatizer"]
+        )
 
-        # Initialize Google Search service, disabling it if keys are missing
-        try:
-            if config.get("SEARCH_API_KEY") and config.get("SEARCH_ENGINE_ID"):
-                self.google_search_service = build("customsearch", "v1", developerKey=config["SEARCH_API_KEY"])
-                logging.info("Google Search service initialized successfully.")
-            else:
-                self.google_search_service = None
-                logging.warning("Google Search credentials not found in .env. Related news feature will be disabled.")
-        except Exception as e:
-            self.google_search_service = None
-            logging.error(f"Could not initialize Google Search service. Feature disabled. Error: {e}")
+        # Pooled HTTP session so repeat fetches reuse keep-alive connections
+        self.http = requests.Session()
+        self.http.headers.update({'User-Agent': 'Mozilla/5.0'})
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=Retry(total=2, backoff_factor=0.3))
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+
+        # Related-news search is a plain REST GET over the pooled session,
+        # so only record whether the credentials are present.
+        self.search_enabled = bool(config.get("SEARCH_API_KEY") and config.get("SEARCH_ENGINE_ID"))
+        if not self.search_enabled:
+            logging.warning("Google Search credentials not found in .env. Related news feature will be disabled.")
+
+        # Extension -> extractor dispatch used by _get_text_from_input
+        self._extractors = {'.docx': self._extract_text_from_docx, '.pdf': self._extract_text_from_pdf}
+        self._extractors.update({ext: self._extract_text_from_image for ext in _IMG_EXTENSIONS})
 
     def _extract_text_from_docx(self, file_path: str) -> Optional[str]:
         try:
             document = docx.Document(file_path)
-            return '\n'.join([para.text for para in document.paragraphs])
+            return '\n'.join(para.text for para in document.paragraphs)
         except Exception as e:
             logging.error(f"Error reading docx file {file_path}: {e}")
             return None
 
     def _extract_text_from_image(self, file_path: str) -> Optional[str]:
         try:
-            return pytesseract.image_to_string(Image.open(file_path))
+            return _ocr_image(Image.open(file_path))
         except Exception as e:
             logging.error(f"Error processing image file {file_path}: {e}")
             return None
 
     def _extract_text_from_pdf(self, file_path: str) -> Optional[str]:
-        full_text = ""
         try:
+            page_texts = []
+            needs_ocr = []
             with pdfplumber.open(file_path) as pdf:
                 for i, page in enumerate(pdf.pages):
                     page_text = page.extract_text()
-                    if page_text and len(page_text.strip()) > 50:
-                        full_text += page_text + '\n'
+                    if page_text and _has_min_nonspace(page_text, 50):
+                        page_texts.append(page_text)
                     else:
-                        try:
-                            page_image = convert_from_path(
-                                file_path, 300, poppler_path=self.poppler_path,
-                                first_page=i + 1, last_page=i + 1
-                            )[0]
-                            ocr_text = pytesseract.image_to_string(page_image, lang='hin+eng')
-                            full_text += ocr_text + '\n'
-                        except Exception as ocr_error:
-                            logging.error(f"OCR failed for page {i + 1}: {ocr_error}")
-                            continue
-            return full_text
+                        page_texts.append("")
+                        needs_ocr.append(i)
+
+                if needs_ocr:
+                    try:
+                        # OCR at a moderate DPI first and re-render only the
+                        # pages Tesseract was unsure about at the higher DPI;
+                        # the pages run in parallel (Tesseract is native code,
+                        # so a process pool scales with cores). pdfplumber
+                        # renders from the already-open document, so no
+                        # per-page rasterizer subprocess is spawned. Every
+                        # page renders and OCRs under its own guard, so one
+                        # corrupt page costs that page, not the whole batch.
+                        rendered = _render_pages(pdf, needs_ocr, _OCR_DPI, file_path)
+                        with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+                            results = list(executor.map(_ocr_image_with_conf_safe,
+                                                        [image for _, image in rendered]))
+                            for (i, _), (ocr_text, _) in zip(rendered, results):
+                                page_texts[i] = ocr_text
+                            retry = [i for (i, _), (_, conf) in zip(rendered, results)
+                                     if conf < _OCR_MIN_CONFIDENCE]
+                            retry_rendered = _render_pages(pdf, retry, _OCR_FALLBACK_DPI, file_path)
+                            retry_results = executor.map(_ocr_image_with_conf_safe,
+                                                         [image for _, image in retry_rendered])
+                            for (i, _), (ocr_text, _) in zip(retry_rendered, retry_results):
+                                if ocr_text:  # keep the first pass if the retry came back empty
+                                    page_texts[i] = ocr_text
+                    except Exception as ocr_error:
+                        logging.error(f"OCR failed for PDF {file_path}: {ocr_error}")
+
+            return ''.join(text + '\n' for text in page_texts)
         except Exception as e:
             logging.error(f"Error reading pdf file {file_path}: {e}")
             return None
 
     def _fetch_and_extract_from_url(self, url: str) -> Optional[str]:
         try:
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(url, headers=headers, timeout=15)
+            response = self.http.get(url, timeout=15)
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = BeautifulSoup(response.text, 'lxml', parse_only=_ONLY_P_TAGS)
             paragraphs = soup.find_all('p')
-            return '\n'.join([p.get_text() for p in paragraphs])
+            return '\n'.join(p.get_text() for p in paragraphs)
         except Exception as e:
             logging.error(f"Failed to process URL {url}. Error: {e}")
             return None
@@ -117,44 +370,35 @@ class MisinformationAnalyzer:
             return self._fetch_and_extract_from_url(source)
         elif os.path.exists(source):
             _, file_extension = os.path.splitext(source)
-            file_extension = file_extension.lower()
-            if file_extension == '.docx':
-                return self._extract_text_from_docx(source)
-            elif file_extension == '.pdf':
-                return self._extract_text_from_pdf(source)
-            elif file_extension in ['.png', '.jpg', '.jpeg', '.tiff', '.bmp']:
-                return self._extract_text_from_image(source)
-            else:
-                logging.error(f"Unsupported file type '{file_extension}'")
-                return None
+            extractor = self._extractors.get(file_extension.lower())
+            if extractor:
+                return extractor(source)
+            logging.error(f"Unsupported file type '{file_extension}'")
+            return None
         else:
             logging.error(f"Input source not found: {source}")
             return None
 
     def _analyze_text_with_gemini(self, text: str) -> Optional[Dict[str, Any]]:
-        prompt = f"""
-        Act as a professional fact-checker. Analyze the following text.
-        Provide your complete analysis as a single JSON object with the following keys:
-        - "verdict": (string, either "REAL" or "FAKE")
-        - "sentiment": (string, e.g., "Neutral", "Biased")
-        - "truthfulness_score": (integer, from 0 to 100)
-        - "main_claim": (string, a one-sentence summary of the main claim)
-        - "analysis_summary": (string, a 2-3 sentence explanation for your verdict)
-        - "scam_category": (string, if the verdict is FAKE, choose ONE from the following list: "Financial Fraud", "Health Misinformation", "Impersonation", "Job Scam", "General Fake News". If the verdict is REAL, this should be "N/A".)
-        - "past_examples": (a list of 1-2 strings with real-world examples that support your analysis)
-        
-        Do not include any text or formatting outside of the JSON object itself.
-
-        Here is the text to analyze:
-        ---
-        {text}
-        ---
-        """
+        # Cap the prompt so a 100-page OCR'd PDF doesn't bill and wait for
+        # tens of thousands of input tokens
+        truncated = len(text) > _MAX_PROMPT_CHARS
+        if truncated:
+            text = _crop_for_prompt(text)
+        prompt = _PROMPT_TEMPLATE.format(text=text)
+        cache_key = _GeminiCache.key_for(text)
+        cached = self.gemini_cache.get(cache_key)
+        if cached is not None:
+            return cached
         try:
             response = self.gemini_model.generate_content(prompt)
-            cleaned_response = response.text.strip().lstrip("```json").rstrip("```")
-            return json.loads(cleaned_response)
-        except json.JSONDecodeError:
+            cleaned_response = _FENCE_RE.sub('', response.text)
+            analysis = orjson.loads(cleaned_response)
+            if truncated:
+                analysis["input_truncated"] = True
+            self.gemini_cache.set(cache_key, analysis)
+            return analysis
+        except orjson.JSONDecodeError:
             logging.error("AI returned an invalid JSON format.")
             return None
         except Exception as e:
@@ -162,29 +406,7 @@ class MisinformationAnalyzer:
             return None
 
     def _get_remedies_and_reporting_info(self, scam_category: str) -> Dict[str, Any]:
-        link_map = {
-            "Financial Fraud": {
-                "link": "https://sachet.rbi.org.in/",
-                "description": "For financial fraud, report to the RBI's Sachet portal and the National Cyber Crime Portal."
-            },
-            "Health Misinformation": {
-                "link": "https://factcheck.pib.gov.in/",
-                "description": "Report health-related fake news to the Press Information Bureau (PIB) Fact Check unit."
-            },
-            "Job Scam": {
-                "link": "https://cybercrime.gov.in/",
-                "description": "Job scams are a serious crime. Report them immediately to the National Cyber Crime Portal."
-            },
-            "Impersonation": {
-                "link": "https://cybercrime.gov.in/",
-                "description": "Report impersonation on the social media platform itself and also to the National Cyber Crime Portal."
-            },
-            "General Fake News": {
-                "link": "https://factcheck.pib.gov.in/",
-                "description": "For general fake news, report to the Press Information Bureau (PIB) Fact Check unit."
-            }
-        }
-        report_info = link_map.get(scam_category, link_map["General Fake News"])
+        report_info = _LINK_MAP.get(scam_category, _LINK_MAP["General Fake News"])
         return {
             "title": f"🚨 Actions & Remedies for: {scam_category}",
             "reporting_link": report_info["link"],
@@ -197,40 +419,55 @@ class MisinformationAnalyzer:
         }
 
     def _get_related_news(self, query: str) -> Optional[List[Dict[str, str]]]:
-        if not self.google_search_service:
-            logging.warning("Skipping related news search because service is not available.")
+        if not self.search_enabled:
+            logging.warning("Skipping related news search because credentials are not available.")
             return None
         logging.info(f"Searching for related news with query: '{query}'")
         try:
-            result = self.google_search_service.cse().list(
-                q=query,
-                cx=self.config.get("SEARCH_ENGINE_ID"),
-                num=3
-            ).execute()
+            response = self.http.get(
+                "https://customsearch.googleapis.com/customsearch/v1",
+                params={
+                    "key": self.config["SEARCH_API_KEY"],
+                    "cx": self.config.get("SEARCH_ENGINE_ID"),
+                    "q": query,
+                    "num": 3,
+                    # Only the title/link pairs are used; skip the rest of
+                    # the Custom Search payload
+                    "fields": "items(title,link)"
+                },
+                timeout=10
+            )
+            response.raise_for_status()
+            result = response.json()
             return [{"title": item['title'], "link": item['link']} for item in result.get('items', [])]
         except Exception as e:
             logging.error(f"Google Search API request failed: {e}")
             return None
 
-    def _extract_entities_with_spacy(self, text: str) -> Dict[str, List[str]]:
-        doc = self.spacy_nlp(text)
-        entities = {}
-        for ent in doc.ents:
-            entities.setdefault(ent.label_, []).append(ent.text)
-        for label in entities:
-            entities[label] = list(sorted(set(entities[label])))
-        return entities
+    def _extract_entities_with_spacy(self, texts: List[str]) -> List[Dict[str, List[str]]]:
+        results = []
+        for doc in self.spacy_nlp.pipe(texts, batch_size=32):
+            entities = defaultdict(set)
+            for ent in doc.ents:
+                entities[ent.label_].add(ent.text)
+            results.append({label: sorted(values) for label, values in entities.items()})
+        return results
 
     def run_full_analysis(self, source: str) -> Optional[Dict[str, Any]]:
         extracted_text = self._get_text_from_input(source)
         if not extracted_text:
             return {"error": "Failed to extract text from the source."}
 
-        gemini_analysis = self._analyze_text_with_gemini(extracted_text)
+        # The Gemini call and spaCy extraction are independent, so overlap
+        # the network-bound Gemini wait with local entity extraction.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            gemini_future = executor.submit(self._analyze_text_with_gemini, extracted_text)
+            spacy_future = executor.submit(self._extract_entities_with_spacy, [extracted_text])
+            gemini_analysis = gemini_future.result()
+            spacy_entities = spacy_future.result()[0]
         if not gemini_analysis:
             return {"error": "Failed to get analysis from Gemini API."}
 
-        spacy_entities = self._extract_entities_with_spacy(extracted_text)
         final_report = {
             "gemini_report": gemini_analysis,
             "named_entities": spacy_entities
@@ -290,7 +527,6 @@ if __name__ == "__main__":
     app_config = {
         "GEMINI_API_KEY": os.getenv("GOOGLE_API_KEY"),
         "TESSERACT_CMD_PATH": os.getenv("TESSERACT_CMD_PATH"),
-        "POPPLER_PATH": os.getenv("POPPLER_PATH"),
         "SEARCH_API_KEY": os.getenv("GOOGLE_SEARCH_API_KEY"),
         "SEARCH_ENGINE_ID": os.getenv("GOOGLE_SEARCH_ENGINE_ID")
     }
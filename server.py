@@ -3,24 +3,32 @@
 # ==============================================================================
 
 # --- PART 1: IMPORTS & SETUP ---
+import concurrent.futures
+import functools
+import hashlib
 import os
-import json
 import logging
+import re
+import sqlite3
+import textwrap
+import time
 from typing import Dict, Any, List, Optional
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
 
+import orjson
 import google.generativeai as genai
 import docx
 import pdfplumber
 import pytesseract
 import spacy
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from PIL import Image
-from googleapiclient.discovery import build
 
 # Load configuration from the .env file
 load_dotenv()
@@ -28,6 +36,102 @@ load_dotenv()
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+_GEMINI_MODEL = 'gemini-1.5-flash-latest'
+_PROMPT_VERSION = "1"
+_MAX_PROMPT_CHARS = 4000
+# Strips markdown code fences without eating legitimate leading/trailing
+# characters the way lstrip/rstrip's character-set semantics would
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+
+# Built once at import; per call only the article text is formatted in.
+_PROMPT_TEMPLATE = textwrap.dedent("""
+    Act as a professional fact-checker. Analyze the following text.
+    Provide your complete analysis as a single JSON object with the following keys:
+    - "verdict": (string, either "REAL" or "FAKE")
+    - "sentiment": (string, e.g., "Neutral", "Biased")
+    - "truthfulness_score": (integer, from 0 to 100)
+    - "main_claim": (string, a one-sentence summary of the main claim)
+    - "analysis_summary": (string, a 2-3 sentence explanation for your verdict)
+    - "scam_category": (string, if FAKE, choose ONE from: "Financial Fraud", "Health Misinformation", "Impersonation", "Job Scam", "General Fake News". If REAL, use "N/A".)
+    - "named_entities": (an object with keys like "PERSON", "ORG" and values as lists of unique strings)
+    Do not include any formatting outside the JSON object itself.
+    Text to analyze: --- {text} ---
+    """)
+
+_LINK_MAP = {
+    "Financial Fraud": {"link": "https://sachet.rbi.org.in/", "description": "Report to the RBI's Sachet portal."},
+    "Health Misinformation": {"link": "https://factcheck.pib.gov.in/", "description": "Report to the Press Information Bureau (PIB) Fact Check unit."},
+    "General Fake News": {"link": "https://factcheck.pib.gov.in/", "description": "Report to the Press Information Bureau (PIB) Fact Check unit."},
+    "Job Scam": {"link": "https://cybercrime.gov.in/", "description": "Report to the National Cyber Crime Portal."},
+    "Impersonation": {"link": "https://cybercrime.gov.in/", "description": "Report to the National Cyber Crime Portal."}
+}
+
+
+def _crop_for_prompt(text: str, limit: int = _MAX_PROMPT_CHARS) -> str:
+    """Caps the text sent to Gemini, cutting at the last line or word break
+    before the limit so the model never sees a word sliced in half."""
+    if len(text) <= limit:
+        return text
+    cropped = text[:limit]
+    boundary = max(cropped.rfind('\n'), cropped.rfind(' '))
+    if boundary > limit // 2:
+        cropped = cropped[:boundary]
+    return cropped
+
+
+# Backing store for _GeminiCache below
+_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_cache.db")
+_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+class _GeminiCache:
+    """A small sqlite-backed cache so repeated texts skip the Gemini API."""
+
+    def __init__(self, path: str = _CACHE_PATH):
+        self._path = path
+        self._connect()
+
+    def _connect(self) -> None:
+        self._conn = sqlite3.connect(self._path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS gemini_cache (key TEXT PRIMARY KEY, response TEXT, created REAL)"
+        )
+        self._conn.commit()
+
+    def reset_connection(self) -> None:
+        """Reopens the sqlite connection; a connection inherited across a
+        fork must not be reused."""
+        self._connect()
+
+    @staticmethod
+    def key_for(text: str) -> str:
+        raw = (_GEMINI_MODEL + _PROMPT_VERSION + text.strip().lower()).encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        # A locked or corrupt cache db is a miss, never a failure
+        try:
+            row = self._conn.execute(
+                "SELECT response, created FROM gemini_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if not row or time.time() - row[1] > _CACHE_TTL_SECONDS:
+                return None
+            return orjson.loads(row[0])
+        except (sqlite3.Error, orjson.JSONDecodeError) as e:
+            logging.warning(f"Gemini cache read failed: {e}")
+            return None
+
+    def set(self, key: str, response: Dict[str, Any]) -> None:
+        # The caller already holds the analysis; losing the write is harmless
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO gemini_cache VALUES (?, ?, ?)",
+                (key, orjson.dumps(response), time.time())
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Gemini cache write failed: {e}")
+
 
 # --- PART 2: THE ANALYSIS CLASS (Unchanged) ---
 # This is the same class we built before
@@ -39,16 +143,34 @@ class MisinformationAnalyzer:
 
         pytesseract.pytesseract.tesseract_cmd = config.get("TESSERACT_CMD_PATH")
         self.config = config
-        self.gemini_model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        self.spacy_nlp = spacy.load("en_core_web_sm")
+        self.gemini_model = genai.GenerativeModel(_GEMINI_MODEL)
+        self.gemini_cache = _GeminiCache()
+        # Only NER output is consumed, so skip the tagger/parser components
+        self.spacy_nlp = spacy.load(
+            "en_core_web_sm",
+            disable=["tagger", "parser", "attribute_ruler", "lemmatizer"]
+        )
 
-        try:
-            if config.get("SEARCH_API_KEY") and config.get("SEARCH_ENGINE_ID"):
-                self.google_search_service = build("customsearch", "v1", developerKey=config["SEARCH_API_KEY"])
-            else:
-                self.google_search_service = None
-        except Exception:
-            self.google_search_service = None
+        self._build_http_session()
+
+        # Related-news search is a plain REST GET over the pooled session,
+        # so only record whether the credentials are present.
+        self.search_enabled = bool(config.get("SEARCH_API_KEY") and config.get("SEARCH_ENGINE_ID"))
+
+    def _build_http_session(self) -> None:
+        # Pooled HTTP session so repeat fetches reuse keep-alive connections
+        self.http = requests.Session()
+        self.http.headers.update({'User-Agent': 'Mozilla/5.0'})
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=Retry(total=2, backoff_factor=0.3))
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+
+    def reset_connections(self) -> None:
+        """Recreates the resources that must not be shared across a fork (the
+        sqlite cache connection and the HTTP session) while keeping the
+        already-loaded spaCy and Gemini models."""
+        self.gemini_cache.reset_connection()
+        self._build_http_session()
 
     def _get_text_from_input(self, text_input: str) -> Optional[str]:
         # A simplified version for a web server; it assumes text is sent directly
@@ -56,36 +178,30 @@ class MisinformationAnalyzer:
         return text_input
 
     def _analyze_text_with_gemini(self, text: str) -> Optional[Dict[str, Any]]:
-        prompt = f"""
-        Act as a professional fact-checker. Analyze the following text.
-        Provide your complete analysis as a single JSON object with the following keys:
-        - "verdict": (string, either "REAL" or "FAKE")
-        - "sentiment": (string, e.g., "Neutral", "Biased")
-        - "truthfulness_score": (integer, from 0 to 100)
-        - "main_claim": (string, a one-sentence summary of the main claim)
-        - "analysis_summary": (string, a 2-3 sentence explanation for your verdict)
-        - "scam_category": (string, if FAKE, choose ONE from: "Financial Fraud", "Health Misinformation", "Impersonation", "Job Scam", "General Fake News". If REAL, use "N/A".)
-        - "named_entities": (an object with keys like "PERSON", "ORG" and values as lists of unique strings)
-        Do not include any formatting outside the JSON object itself.
-        Text to analyze: --- {text} ---
-        """
+        # Cap the prompt so very long inputs don't bill and wait for
+        # tens of thousands of input tokens
+        truncated = len(text) > _MAX_PROMPT_CHARS
+        if truncated:
+            text = _crop_for_prompt(text)
+        prompt = _PROMPT_TEMPLATE.format(text=text)
+        cache_key = _GeminiCache.key_for(text)
+        cached = self.gemini_cache.get(cache_key)
+        if cached is not None:
+            return cached
         try:
             response = self.gemini_model.generate_content(prompt)
-            cleaned_response = response.text.strip().lstrip("```json").rstrip("```")
-            return json.loads(cleaned_response)
+            cleaned_response = _FENCE_RE.sub('', response.text)
+            analysis = orjson.loads(cleaned_response)
+            if truncated:
+                analysis["input_truncated"] = True
+            self.gemini_cache.set(cache_key, analysis)
+            return analysis
         except Exception as e:
             logging.error(f"Gemini API Error: {e}")
             return None
 
     def _get_remedies_and_reporting_info(self, scam_category: str) -> Dict[str, Any]:
-        link_map = {
-            "Financial Fraud": {"link": "https://sachet.rbi.org.in/", "description": "Report to the RBI's Sachet portal."},
-            "Health Misinformation": {"link": "https://factcheck.pib.gov.in/", "description": "Report to the Press Information Bureau (PIB) Fact Check unit."},
-            "General Fake News": {"link": "https://factcheck.pib.gov.in/", "description": "Report to the Press Information Bureau (PIB) Fact Check unit."},
-            "Job Scam": {"link": "https://cybercrime.gov.in/", "description": "Report to the National Cyber Crime Portal."},
-            "Impersonation": {"link": "https://cybercrime.gov.in/", "description": "Report to the National Cyber Crime Portal."}
-        }
-        info = link_map.get(scam_category, link_map["General Fake News"])
+        info = _LINK_MAP.get(scam_category, _LINK_MAP["General Fake News"])
         return {
             "title": f"🚨 Actions & Remedies for: {scam_category}",
             "reporting_link": info["link"],
@@ -94,9 +210,23 @@ class MisinformationAnalyzer:
         }
 
     def _get_related_news(self, query: str) -> Optional[List[Dict[str, str]]]:
-        if not self.google_search_service: return None
+        if not self.search_enabled: return None
         try:
-            result = self.google_search_service.cse().list(q=query, cx=self.config.get("SEARCH_ENGINE_ID"), num=3).execute()
+            response = self.http.get(
+                "https://customsearch.googleapis.com/customsearch/v1",
+                params={
+                    "key": self.config["SEARCH_API_KEY"],
+                    "cx": self.config.get("SEARCH_ENGINE_ID"),
+                    "q": query,
+                    "num": 3,
+                    # Only the title/link pairs are used; skip the rest of
+                    # the Custom Search payload
+                    "fields": "items(title,link)"
+                },
+                timeout=10
+            )
+            response.raise_for_status()
+            result = response.json()
             return [{"title": item['title'], "link": item['link']} for item in result.get('items', [])]
         except Exception as e:
             logging.error(f"Google Search API Error: {e}")
@@ -125,32 +255,67 @@ class MisinformationAnalyzer:
 app = Flask(__name__)
 CORS(app)  # This enables the frontend to communicate with the backend
 
-# Load the analyzer once when the server starts
-app_config = {
-    "GEMINI_API_KEY": os.getenv("GOOGLE_API_KEY"),
-    "TESSERACT_CMD_PATH": os.getenv("TESSERACT_CMD_PATH"),
-    "SEARCH_API_KEY": os.getenv("GOOGLE_SEARCH_API_KEY"),
-    "SEARCH_ENGINE_ID": os.getenv("GOOGLE_SEARCH_ENGINE_ID")
-}
-analyzer = MisinformationAnalyzer(config=app_config)
+@functools.lru_cache(maxsize=1)
+def _get_analyzer() -> MisinformationAnalyzer:
+    """Builds the analyzer once per process, however many times it is called."""
+    app_config = {
+        "GEMINI_API_KEY": os.getenv("GOOGLE_API_KEY"),
+        "TESSERACT_CMD_PATH": os.getenv("TESSERACT_CMD_PATH"),
+        "SEARCH_API_KEY": os.getenv("GOOGLE_SEARCH_API_KEY"),
+        "SEARCH_ENGINE_ID": os.getenv("GOOGLE_SEARCH_ENGINE_ID")
+    }
+    return MisinformationAnalyzer(config=app_config)
+
+
+# Populate the cached factory at import time: the analysis pool's forked
+# workers (and the workers of a server started with `gunicorn -w N
+# --preload server:app`) then inherit the spaCy weights copy-on-write
+# instead of reloading them per process; _init_worker below only reopens
+# the per-process connections.
+_get_analyzer()
+
+
+def _init_worker() -> None:
+    """Prepares a forked pool worker: keep the analyzer inherited from the
+    parent — its spaCy weights stay shared copy-on-write — and reopen only
+    the sqlite and HTTP connections, which must not cross a fork."""
+    _get_analyzer().reset_connections()
+
+
+def _run_analysis(text: str) -> Optional[Dict[str, Any]]:
+    return _get_analyzer().run_full_analysis(text)
+
+
+# CPU-bound analysis runs in this pool so concurrent requests spread
+# across cores instead of serializing on the Flask worker thread.
+_analysis_pool = concurrent.futures.ProcessPoolExecutor(
+    max_workers=os.cpu_count(), initializer=_init_worker
+)
+
+def _json_response(payload: Any, status: int = 200) -> Response:
+    """Serializes a response with orjson instead of Flask's stdlib jsonify."""
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+
 
 @app.route('/analyze', methods=['POST'])
 def analyze_endpoint():
     """API endpoint to handle analysis requests from the frontend."""
     data = request.get_json()
     if not data or 'text' not in data:
-        return jsonify({"error": "No text provided"}), 400
+        return _json_response({"error": "No text provided"}, 400)
 
     text_to_analyze = data['text']
     try:
-        result = analyzer.run_full_analysis(text_to_analyze)
+        future = _analysis_pool.submit(_run_analysis, text_to_analyze)
+        result = future.result(timeout=60)
         if result and "error" in result:
-             return jsonify(result), 500
-        return jsonify(result)
+             return _json_response(result, 500)
+        return _json_response(result)
     except Exception as e:
         logging.error(f"A critical error occurred: {e}")
-        return jsonify({"error": "An internal server error occurred."}), 500
+        return _json_response({"error": "An internal server error occurred."}, 500)
 
 if __name__ == '__main__':
-    # Runs the server on http://127.0.0.1:5000
-    app.run(port=5000, debug=True)
+    # Runs the dev server on http://127.0.0.1:5000; in production prefer
+    # `gunicorn -w 4 --preload server:app` so models load once per host.
+    app.run(port=5000, debug=True, threaded=True)